@@ -6,13 +6,25 @@ Created on Thu Mar  7 08:31:25 2024
 @author: ian
 """
 import functools
+import io
+import itertools
+import logging
 import os
 import psycopg2
 import getpass
 import configparser
 from psycopg2 import sql
+from psycopg2 import pool
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, date
+
+logger = logging.getLogger(__name__)
+
+# Pools shared across instances, keyed by (dbname, host, port, user)
+_poolCache = {}
+
+# Unique suffixes for server-side prepared-statement and cursor names
+_statementCounter = itertools.count()
 
 
 class nisarcryodb():
@@ -23,7 +35,8 @@ class nisarcryodb():
 
 #    __metaclass__ = ABCMeta
 
-    def __init__(self, configFile='./calvaldb_config.ini'):
+    def __init__(self, configFile='./calvaldb_config.ini', usePool=False,
+                 maxConnections=8):
         '''
         Class for retrieving cryo data from NISAR cal/val database
 
@@ -31,6 +44,12 @@ class nisarcryodb():
         ----------
         configFile : str, optional
             Data base cconfig file. The default is './calvaldb_config.ini'.
+        usePool : bool, optional
+            Draw the connection from a shared connection pool rather than
+            opening a fresh one, which avoids the connection handshake when
+            instances are created repeatedly. The default is False.
+        maxConnections : int, optional
+            Maximum number of connections in the pool. The default is 8.
 
         Returns
         -------
@@ -38,8 +57,22 @@ class nisarcryodb():
 
         '''
         self.connection = None
+        self.usePool = usePool
+        self.maxConnections = maxConnections
+        self._pool = None
+        self._colCache = {}
+        self._colValCache = {}
+        self._stationIdCache = {}
+        self._preparedStatements = {}
         self._initDB(configFile)
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
     def rollBackOnError(func):
         ''' Error handler (decorator) to automatically do database rollback
         when something goes wrong '''
@@ -94,17 +127,66 @@ class nisarcryodb():
         if not dbname or not host or not port:
             raise Exception("Missing required properties")
         #
-        # Get username and password
-        user = input('User name: ')
-        password = getpass.getpass('Password: ')
+        # Get the user name, prompting only if the config file doesn't
+        # provide it. The password is resolved only where a new connection
+        # is actually opened, so reusing an existing pool never prompts.
+        user = conn_properties.get('user')
+        if not user:
+            user = input('User name: ')
         #
-        self.connection = psycopg2.connect(dbname=dbname,
-                                           host=host,
-                                           port=port,
-                                           user=user,
-                                           password=password)
+        if self.usePool:
+            key = (dbname, host, port, user)
+            if key not in _poolCache:
+                _poolCache[key] = pool.ThreadedConnectionPool(
+                    1, self.maxConnections, dbname=dbname, host=host,
+                    port=port, user=user,
+                    password=self._getPassword(conn_properties, user))
+            self._pool = _poolCache[key]
+            self.connection = self._pool.getconn()
+        else:
+            self.connection = psycopg2.connect(
+                dbname=dbname,
+                host=host,
+                port=port,
+                user=user,
+                password=self._getPassword(conn_properties, user))
         self.cursor = self.connection.cursor()
 
+    def _getPassword(self, conn_properties, user):
+        '''
+        Resolve the database password without prompting where possible:
+        from the environment variable named by password_env in the config
+        file, then from the system keyring if installed, and only then by
+        prompting. Non-interactive resolution lets connections be rebuilt
+        programmatically (e.g., for pooling or reconnects).
+
+        Parameters
+        ----------
+        conn_properties : configparser section
+            The [DEFAULT] section of the config file.
+        user : str
+            Database user name.
+
+        Returns
+        -------
+        str
+            The password.
+
+        '''
+        passwordEnv = conn_properties.get('password_env')
+        if passwordEnv and passwordEnv in os.environ:
+            return os.environ[passwordEnv]
+        try:
+            import keyring
+            password = keyring.get_password('nisarcryodb', user)
+            if password is not None:
+                return password
+        except Exception:
+            # No keyring installed, or no usable backend (e.g., headless
+            # server raising NoKeyringError) - fall through to the prompt
+            pass
+        return getpass.getpass('Password: ')
+
     @rollBackOnError
     def listSchema(self, quiet=False):
         '''
@@ -177,30 +259,98 @@ class nisarcryodb():
             list with the types for each column (returnType=True).
 
         '''
-        query = "SELECT column_name, data_type " \
-            "FROM information_schema.columns WHERE " \
-            "table_schema = %(schema_Name)s AND table_name = %(table_Name)s;"
-        # do query
-        self.cursor.execute(query, {'schema_Name': schemaName,
-                                    'table_Name': tableName})
-        columns = self.cursor.fetchall()
-        #
-        columnNames = [k[0] for k in columns]
+        key = (schemaName, tableName)
+        if key not in self._colCache:
+            query = "SELECT column_name, data_type " \
+                "FROM information_schema.columns WHERE " \
+                "table_schema = %(schema_Name)s AND " \
+                "table_name = %(table_Name)s;"
+            # do query
+            self.cursor.execute(query, {'schema_Name': schemaName,
+                                        'table_Name': tableName})
+            self._colCache[key] = self.cursor.fetchall()
+        columns = self._colCache[key]
         #
+        # Unpack names and types in a single pass
+        if columns:
+            columnNames, types = map(list, zip(*columns))
+        else:
+            columnNames, types = [], []
         if not quiet:
             print(', '.join(columnNames))
         if returnType:
-            types = [k[1] for k in columns]
             if not quiet:
                 print(', '.join(types))
             return columnNames, types
         return columnNames
 
+    def invalidateColumnCache(self):
+        '''
+        Clear the cached column metadata (e.g., after a DDL change so the
+        next listTableColumns call requeries the database).
+
+        Returns
+        -------
+        None.
+
+        '''
+        self._colCache = {}
+
+    def iterColumn(self, schemaName, tableName, columnName, distinct=False,
+                   orderBy=False, limit=None, chunkSize=10000):
+        '''
+        Yield values for a column schemaName.tableName, streaming through a
+        server-side cursor so memory stays bounded even for columns with
+        millions of (distinct) values.
+
+        Parameters
+        ----------
+        schemaName : str
+            Name of the schema.
+        tableName : str
+            Name of the table.
+        columnName : str
+            column name
+        distinct : bool, optional
+            Return only unique values if true. The default is False.
+        orderBy : bool, optional
+            Sort the values on the server. The default is False.
+        limit : int, optional
+            Return at most this many values. The default is None (all).
+        chunkSize : int, optional
+            Rows fetched from the server at a time. The default is 10000.
+
+        Yields
+        ------
+        The values for the column.
+
+        '''
+        distinctOption = 'DISTINCT' if distinct else ''
+        query = sql.SQL(f"SELECT {distinctOption} {{}} FROM {{}}.{{}}").format(
+            sql.Identifier(columnName),
+            sql.Identifier(schemaName),
+            sql.Identifier(tableName))
+        if orderBy:
+            query += sql.SQL(" ORDER BY {}").format(sql.Identifier(columnName))
+        substitutions = {}
+        if limit is not None:
+            query += sql.SQL(" LIMIT %(limit)s")
+            substitutions['limit'] = limit
+        #
+        # Unique name so concurrent iterators on one connection don't clash
+        with self.connection.cursor(
+                name=f'nisarcryodb_col_{next(_statementCounter)}') as cursor:
+            cursor.itersize = chunkSize
+            cursor.execute(query + sql.SQL(";"), substitutions)
+            for row in cursor:
+                yield row[0]
+
     @rollBackOnError
-    def getColumn(self, schemaName, tableName, columnName, distinct=False):
+    def getColumn(self, schemaName, tableName, columnName, distinct=False,
+                  orderBy=False, limit=None):
         '''
         Get values for a column schemaName.tableName
-    
+
         Parameters
         ----------
         schemaName : str
@@ -211,21 +361,45 @@ class nisarcryodb():
             column name
         distinct : bool, optional
             Return only unique values if true. The default is False.
+        orderBy : bool, optional
+            Sort the values on the server. The default is False.
+        limit : int, optional
+            Return at most this many values. The default is None (all).
         Returns
         -------
         uniqueVals : list
             The values for the column.
-    
+
         '''
-        distinctOption = {True: 'DISTINCT', False: ''}[distinct]
-        query = sql.SQL(f"SELECT {distinctOption} {{}} FROM "
-                        f"{schemaName}.{tableName};")
-        #
-        self.cursor.execute(query.format(sql.Identifier(columnName)))
-        return [k[0] for k in self.cursor.fetchall()]
+        # Cache distinct results so repeated enumerations (e.g., station or
+        # product type lists) don't rescan the table. Non-distinct fetches
+        # can run to millions of values, so leave those uncached.
+        if not distinct:
+            return list(self.iterColumn(schemaName, tableName, columnName,
+                                        orderBy=orderBy, limit=limit))
+        key = (schemaName, tableName, columnName, orderBy, limit)
+        if key not in self._colValCache:
+            self._colValCache[key] = list(
+                self.iterColumn(schemaName, tableName, columnName,
+                                distinct=True, orderBy=orderBy,
+                                limit=limit))
+        return self._colValCache[key]
+
+    def invalidateColumnValueCache(self):
+        '''
+        Clear the cached getColumn results so the next call requeries the
+        database (e.g., after new data are ingested).
+
+        Returns
+        -------
+        None.
+
+        '''
+        self._colValCache = {}
 
     @rollBackOnError
-    def getTableListing(self, schemaName='landice', tableName='gps_station', filters={}):
+    def getTableListing(self, schemaName='landice', tableName='gps_station',
+                        filters={}, columns=None, useCopy=False):
         '''
         Get the station information (e.g. station_id, station_name, ref_lat...)
 
@@ -235,6 +409,12 @@ class nisarcryodb():
             Name of schema. The default is 'landice'.
         tableName : str, optional
             Name of table with station info . The default is 'gps_station'.
+        columns : list of str, optional
+            Only fetch these columns rather than all of them, which cuts
+            the bytes transferred. The default is None (all columns).
+        useCopy : bool, optional
+            Fetch via COPY ... TO STDOUT, which is faster for large
+            results. The default is False.
 
         Returns
         -------
@@ -245,19 +425,152 @@ class nisarcryodb():
         substitutions = {}
         #
         filterString = self._filterString(filters, substitutions, first=True)
-        
-        query = f"SELECT * FROM {schemaName}.{tableName} {filterString};"
-        # print(query)
+
+        query = sql.SQL("SELECT {} FROM {}.{}").format(
+            self._columnProjection(columns),
+            sql.Identifier(schemaName),
+            sql.Identifier(tableName)) + filterString + sql.SQL(";")
+        logger.debug('query: %s', query)
+        if useCopy:
+            return self._copyQueryToDataFrame(query, substitutions)
         self.cursor.execute(query, substitutions)
+        # Column labels come with the result, so no metadata query needed
         return pd.DataFrame(self.cursor.fetchall(),
-                            columns=self.listTableColumns(schemaName,
-                                                          tableName,
-                                                          quiet=True))
+                            columns=[d.name for d in
+                                     self.cursor.description])
+
+    def _columnProjection(self, columns):
+        '''
+        Build the select-list for a query: '*' if columns is None, else the
+        quoted column names so only the requested columns come over the
+        wire.
+
+        Parameters
+        ----------
+        columns : list of str or None
+            Columns to select, or None for all.
+
+        Returns
+        -------
+        psycopg2.sql.Composable
+            Select-list for the query.
+
+        '''
+        if columns is None:
+            return sql.SQL('*')
+        return sql.SQL(', ').join([sql.Identifier(c) for c in columns])
+
+    def _executePrepared(self, statement, argTypes, params):
+        '''
+        Execute a server-side prepared statement, issuing the PREPARE only
+        the first time a given statement text is seen so repeated calls
+        (e.g., name lookups in a loop over stations) skip the parse/plan
+        step.
+
+        Parameters
+        ----------
+        statement : psycopg2.sql.SQL
+            Statement to prepare, with $1, $2... for the parameters.
+        argTypes : list of str
+            PostgreSQL types for the parameters (e.g., ['text']).
+        params : tuple
+            Parameter values for this execution.
+
+        Returns
+        -------
+        None (results available on self.cursor).
+
+        '''
+        key = statement.as_string(self.cursor)
+        if key not in self._preparedStatements:
+            name = f'nisarcryodb_{next(_statementCounter)}'
+            prepare = sql.SQL("PREPARE {} ({}) AS ").format(
+                sql.Identifier(name),
+                sql.SQL(', ').join([sql.SQL(t) for t in argTypes]))
+            self.cursor.execute(prepare + statement)
+            self._preparedStatements[key] = name
+        placeholders = sql.SQL(', ').join(sql.Placeholder() * len(params))
+        self.cursor.execute(
+            sql.SQL("EXECUTE {} ({});").format(
+                sql.Identifier(self._preparedStatements[key]), placeholders),
+            params)
+
+    def _copyQueryToDataFrame(self, query, substitutions):
+        '''
+        Run a SELECT via COPY ... TO STDOUT WITH CSV and parse the stream
+        with pd.read_csv. This bypasses the per-cell Python object creation
+        of fetchall(), which is substantially faster for large numeric
+        result sets.
+
+        Parameters
+        ----------
+        query : str
+            SELECT statement to execute.
+        substitutions : dict
+            Values for the query placeholders.
+
+        Returns
+        -------
+        pandas data frame
+            Query result with columns labeled from the CSV header.
+
+        '''
+        # Bind the parameters client side since COPY takes a literal query
+        if not isinstance(query, str):
+            query = query.as_string(self.cursor)
+        innerSelect = self.cursor.mogrify(query,
+                                          substitutions).decode().rstrip(';')
+        copyQuery = f"COPY ({innerSelect}) TO STDOUT WITH CSV HEADER;"
+        buffer = io.BytesIO()
+        self.cursor.copy_expert(copyQuery, buffer)
+        buffer.seek(0)
+        return pd.read_csv(buffer)
+
+    def _iterQueryChunks(self, query, substitutions, chunkSize):
+        '''
+        Execute query on a server-side (named) cursor and yield the result
+        as DataFrames of at most chunkSize rows, so memory use is bounded
+        by the chunk size rather than the full result set. The cursor
+        description (and hence the column labels) only populates after the
+        first fetch on a named cursor, so the first chunk is fetched before
+        labeling; at least one (possibly empty) DataFrame is always
+        yielded.
+
+        Parameters
+        ----------
+        query : str
+            Query to execute.
+        substitutions : dict
+            Values for the query placeholders.
+        chunkSize : int
+            Maximum number of rows per chunk.
+
+        Yields
+        ------
+        pandas data frame
+            Successive chunks of the result.
+
+        '''
+        # Unique name so concurrent iterators on one connection don't clash
+        with self.connection.cursor(
+                name=f'nisarcryodb_{next(_statementCounter)}') as cursor:
+            cursor.itersize = chunkSize
+            cursor.execute(query, substitutions)
+            # execute only issues the DECLARE; description is None until
+            # the first fetch (populated then, even for empty results)
+            rows = cursor.fetchmany(chunkSize)
+            columns = [d.name for d in cursor.description]
+            yield pd.DataFrame(rows, columns=columns)
+            while rows:
+                rows = cursor.fetchmany(chunkSize)
+                if rows:
+                    yield pd.DataFrame(rows, columns=columns)
 
     @rollBackOnError
     def getStationDateRangeData(self, stationName, d1, d2,
-                                schemaName='landice', tableName='gps_data', 
-                                filters={}):
+                                schemaName='landice', tableName='gps_data',
+                                filters={}, columns=None, chunkSize=None,
+                                useCopy=False):
         '''
         Return as a pandas data fram the results for stationName for the
         inveral [d1, d2]
@@ -278,37 +591,137 @@ class nisarcryodb():
             dict with field to filter and value to filter
             (e.g., {'product_path': '%vv%'}, where % is a SQL wildcard)
             Default is None
+        columns : list of str, optional
+            Only fetch these columns rather than all of them, which cuts
+            the bytes transferred. The default is None (all columns).
+        chunkSize : int, optional
+            Stream the result through a server-side cursor in chunks of
+            this many rows rather than buffering it all client side.
+            The default is None (fetch everything at once).
+        useCopy : bool, optional
+            Fetch via COPY ... TO STDOUT, which is faster for large
+            results. The default is False.
         Returns
         -------
         pandas data frame
             GPS data for the station and date range..
 
         '''
-       
+
         stationID = self.stationNameToID(stationName, schemaName=schemaName)
+        # With no dynamic filters the statement shape is fixed, so reuse a
+        # server-side prepared plan across calls
+        if not filters and not useCopy and chunkSize is None:
+            statement = sql.SQL(
+                "SELECT {} FROM {}.{} WHERE "
+                "decimal_year BETWEEN $1 AND $2 AND station_id = $3 "
+                "ORDER BY decimal_year").format(
+                    self._columnProjection(columns),
+                    sql.Identifier(schemaName),
+                    sql.Identifier(tableName))
+            self._executePrepared(statement, ['float8', 'float8', 'int'],
+                                  (d1, d2, stationID))
+            return pd.DataFrame(self.cursor.fetchall(),
+                                columns=[d.name for d in
+                                         self.cursor.description])
         substitutions = {'val1': d1, 'val2': d2, 'station_id': stationID}
         #
         filterString = self._filterString(filters, substitutions, first=False)
         #
-        query = f"SELECT * FROM {schemaName}.{tableName} WHERE " \
-            "decimal_year BETWEEN %(val1)s AND %(val2)s AND " \
-            f"station_id = %(station_id)s {filterString};"
-        # print(query)
+        # Sort on the server where an index on (station_id, decimal_year)
+        # can do it for free
+        query = sql.SQL("SELECT {} FROM {}.{} WHERE "
+                        "decimal_year BETWEEN %(val1)s AND %(val2)s AND "
+                        "station_id = %(station_id)s").format(
+                            self._columnProjection(columns),
+                            sql.Identifier(schemaName),
+                            sql.Identifier(tableName)) + \
+            filterString + sql.SQL(" ORDER BY decimal_year;")
+        logger.debug('query: %s', query)
+        if useCopy:
+            return self._copyQueryToDataFrame(query, substitutions)
+        # Stream via a named cursor so memory stays bounded by chunkSize
+        if chunkSize is not None:
+            return pd.concat(self._iterQueryChunks(query, substitutions,
+                                                   chunkSize),
+                             ignore_index=True)
         # Perform query
         self.cursor.execute(query,
                             substitutions)
+        # Column labels come with the result, so no metadata query needed
         return pd.DataFrame(self.cursor.fetchall(),
-                            columns=self.listTableColumns(schemaName,
-                                                          tableName,
-                                                          quiet=True))
+                            columns=[d.name for d in
+                                     self.cursor.description])
 
-    def _dateToStr(self, date, format='%Y-%m-%d'):
+    @rollBackOnError
+    def getStationDateRangeDataBatch(self, stationNames, d1, d2,
+                                     schemaName='landice',
+                                     tableName='gps_data',
+                                     stationTableName='gps_station',
+                                     filters={}):
         '''
-        Take a date as str or datetime and return str with format
+        Return the data for several stations for the interval [d1, d2] with
+        a single query. Avoids the per-station name-lookup and data-fetch
+        round trips of calling getStationDateRangeData in a loop.
+
+        Parameters
+        ----------
+        stationNames : list of str
+            Station names (e.g., ['NIT1', 'NIT3']).
+        d1 : float
+            Decimal date for start of window.
+        d2 : float
+            Decimal date for end of window.
+        schemaName : str, optional
+            Schema name. The default is 'landice'
+        tableName : str, optional
+            Name of data table. The default is 'gps_data'.
+        stationTableName : str, optional
+            Name of table with station info. The default is 'gps_station'.
+        filters : dict, optional
+            dict with field to filter and value to filter
+            (e.g., {'product_path': '%vv%'}, where % is a SQL wildcard)
+            Default is None
+        Returns
+        -------
+        dict of pandas data frames
+            GPS data for the date range, keyed by station name.
+
+        '''
+        substitutions = {'val1': d1, 'val2': d2,
+                         'station_names': list(stationNames)}
+        #
+        filterString = self._filterString(filters, substitutions, first=False)
+        # Join on the station table so all names resolve in the same query
+        query = sql.SQL("SELECT s.station_name, d.* FROM {}.{} d "
+                        "JOIN {}.{} s ON d.station_id = s.station_id WHERE "
+                        "s.station_name = ANY(%(station_names)s) AND "
+                        "d.decimal_year BETWEEN %(val1)s AND "
+                        "%(val2)s").format(
+                            sql.Identifier(schemaName),
+                            sql.Identifier(tableName),
+                            sql.Identifier(schemaName),
+                            sql.Identifier(stationTableName)) + \
+            filterString + sql.SQL(" ORDER BY d.decimal_year;")
+        self.cursor.execute(query, substitutions)
+        result = pd.DataFrame(self.cursor.fetchall(),
+                              columns=[d.name for d in
+                                       self.cursor.description])
+        # Split the single result set by station
+        return {name: data.drop(columns='station_name').reset_index(drop=True)
+                for name, data in result.groupby('station_name')}
+
+    def _toDate(self, dateValue):
+        '''
+        Take a date as a "%Y-%m-%d" str, datetime, or date and return a
+        datetime.date, which psycopg2 binds natively. Invalid strings
+        raise here rather than wasting a round trip on a failed query.
         '''
-        if isinstance(date, datetime):
-            return date.strftime(format)
-        return date
+        if isinstance(dateValue, datetime):
+            return dateValue.date()
+        if isinstance(dateValue, date):
+            return dateValue
+        return datetime.strptime(dateValue, '%Y-%m-%d').date()
 
     def _filterString(self, filters, substitutions, first=True):
         '''
@@ -320,24 +733,34 @@ class nisarcryodb():
             dict with field to filter and value to filter
             (e.g., {'product_path': '%vv%'}, where % is a SQL wildcard)
             Default is None
+
+        Returns
+        -------
+        psycopg2.sql.Composable
+            The filter clauses with the field names safely quoted.
         '''
-        filterString = ''
+        filterParts = []
         connector = {True: 'WHERE', False: 'AND'}[first]
+        if filters is None:
+            filters = {}
         for filt in filters:
-            print(filt)
+            logger.debug('Adding filter %s', filt)
             if type(filters[filt]) is str:
                 operator = "LIKE"
             else:
                 operator = "="
-            filterString += f" {connector} {filt} {operator} %({filt})s"
+            filterParts.append(
+                sql.SQL(f" {connector} {{}} {operator} %({filt})s").format(
+                    sql.Identifier(filt)))
             substitutions[filt] = filters[filt]
             connector = 'AND'  # all subsequent filters are ands
-        return filterString
+        return sql.Composed(filterParts)
             
     @rollBackOnError
     def getL3DateRangeData(self, date1, date2,
                            schemaName='landice', tableName='l3_product',
-                           filters=None):
+                           filters=None, columns=None, chunkSize=None,
+                           useCopy=False):
         '''
         Return as a pandas data fram the results for stationName for the
         inveral date1 <= start_date and end_date <= date2
@@ -358,6 +781,16 @@ class nisarcryodb():
             dict with field to filter and value to filter
             (e.g., {'product_path': '%vv%'}, where % is a SQL wildcard)
             Default is None
+        columns : list of str, optional
+            Only fetch these columns rather than all of them, which cuts
+            the bytes transferred. The default is None (all columns).
+        chunkSize : int, optional
+            Stream the result through a server-side cursor in chunks of
+            this many rows rather than buffering it all client side.
+            The default is None (fetch everything at once).
+        useCopy : bool, optional
+            Fetch via COPY ... TO STDOUT, which is faster for large
+            results. The default is False.
 
         Returns
         -------
@@ -365,24 +798,36 @@ class nisarcryodb():
             GPS data for the station and date range.
 
         '''
-        date1 = self._dateToStr(date1)
-        date2 = self._dateToStr(date2)
+        date1 = self._toDate(date1)
+        date2 = self._toDate(date2)
+        if date1 > date2:
+            raise ValueError(f'date1 ({date1}) falls after date2 ({date2})')
         #
         # Add additional filters to date filters
         substitutions = {'val1': date1, 'val2': date2}
         filterString =  self._filterString(filters, substitutions, first=False)
-        # print(filterString)
+        logger.debug('filterString: %s', filterString)
         #
-        query = f"SELECT * FROM {schemaName}.{tableName} WHERE " \
-                f"start_date >= %(val1)s AND end_date <= %(val2)s " \
-                f"{filterString} ORDER BY product_id;"
-        # print(query)
+        query = sql.SQL("SELECT {} FROM {}.{} WHERE "
+                        "start_date >= %(val1)s AND "
+                        "end_date <= %(val2)s").format(
+                            self._columnProjection(columns),
+                            sql.Identifier(schemaName),
+                            sql.Identifier(tableName)) + \
+            filterString + sql.SQL(" ORDER BY product_id;")
+        logger.debug('query: %s', query)
         #
+        if useCopy:
+            return self._copyQueryToDataFrame(query, substitutions)
+        if chunkSize is not None:
+            return pd.concat(self._iterQueryChunks(query, substitutions,
+                                                   chunkSize),
+                             ignore_index=True)
         self.cursor.execute(query, substitutions)
+        # Column labels come with the result, so no metadata query needed
         return pd.DataFrame(self.cursor.fetchall(),
-                            columns=self.listTableColumns(schemaName,
-                                                          tableName,
-                                                          quiet=True))
+                            columns=[d.name for d in
+                                     self.cursor.description])
 
     @rollBackOnError
     def getL3DateRangeProducts(self, date1, date2,
@@ -408,22 +853,36 @@ class nisarcryodb():
             Default is None
         Returns
         -------
-        pandas data frame
-            GPS data for the station and date range.
+        dict
+            Product paths keyed by 'start_date.end_date' then component
+            (vx, vy, vv).
         '''
-        result = self.getL3DateRangeData(date1, date2,
-                                         schemaName=schemaName,
-                                         tableName=tableName,
-                                         filters=filters)
+        date1 = self._toDate(date1)
+        date2 = self._toDate(date2)
+        if date1 > date2:
+            raise ValueError(f'date1 ({date1}) falls after date2 ({date2})')
+        #
+        substitutions = {'val1': date1, 'val2': date2}
+        filterString = self._filterString(filters, substitutions, first=False)
+        # Classify the paths on the server so only the rows with a velocity
+        # component (and only the columns used) come over the wire
+        query = sql.SQL(
+            "SELECT start_date, end_date, comp, product_path FROM ("
+            "SELECT product_id, start_date, end_date, product_path, "
+            "CASE WHEN product_path LIKE '%%vx%%' THEN 'vx' "
+            "WHEN product_path LIKE '%%vy%%' THEN 'vy' "
+            "WHEN product_path LIKE '%%vv%%' THEN 'vv' END AS comp "
+            "FROM {}.{} WHERE start_date >= %(val1)s AND "
+            "end_date <= %(val2)s").format(
+                sql.Identifier(schemaName),
+                sql.Identifier(tableName)) + filterString + \
+            sql.SQL(") q WHERE comp IS NOT NULL ORDER BY product_id;")
+        self.cursor.execute(query, substitutions)
         #
         products = {}
-        for row in result.iterrows():
-            key = f"{row[1]['start_date']}.{row[1]['end_date']}"
-            if key not in products:
-                products[key] = {}
-            for component in ['vx', 'vy', 'vv']:
-                if component in row[1]['product_path']:
-                    products[key][component] = row[1]['product_path']
+        for startDate, endDate, component, path in self.cursor.fetchall():
+            products.setdefault(f'{startDate}.{endDate}', {})[component] = \
+                path
         return products
 
     @rollBackOnError
@@ -447,26 +906,76 @@ class nisarcryodb():
             Station id.
 
         '''
-        query = f"SELECT * FROM {schemaName}.{tableName} " \
-            "WHERE station_name = %(station_name)s;"
-        #
-        self.cursor.execute(query, {'station_name': stationName})
-        # Build a dict to map name to id
-        values = self.cursor.fetchall()[0]
-        keys = self.listTableColumns(schemaName, tableName, quiet=True)
-        lookup = dict(zip(keys, values))
-        # return result for specified
-        return lookup['station_id']
+        key = (schemaName, tableName, stationName)
+        if key not in self._stationIdCache:
+            self.stationNamesToIDs([stationName], schemaName=schemaName,
+                                   tableName=tableName)
+        if key not in self._stationIdCache:
+            raise KeyError(f'No station found with name {stationName}')
+        return self._stationIdCache[key]
+
+    @rollBackOnError
+    def stationNamesToIDs(self, stationNames,
+                          schemaName='landice', tableName='gps_station'):
+        '''
+        Return a dict mapping station_name to station_id for several
+        stations, resolving all cache misses with a single query rather
+        than one round trip per station.
+
+        Parameters
+        ----------
+        stationNames : list of str
+            Station names (e.g., ['NIT1', 'NIT3']).
+        schemaName : str, optional
+            Schema name. The default is 'landice'
+        tableName : str, optional
+            Name of data table. The default is 'gps_station'.
+
+        Returns
+        -------
+        dict
+            station_name to station_id for the stations that exist.
+
+        '''
+        lookup = {}
+        missing = []
+        for name in stationNames:
+            key = (schemaName, tableName, name)
+            if key in self._stationIdCache:
+                lookup[name] = self._stationIdCache[key]
+            else:
+                missing.append(name)
+        if missing:
+            # Resolve all the misses in one query. A prepared statement
+            # skips re-parsing on repeated lookups.
+            statement = sql.SQL("SELECT station_name, station_id FROM {}.{} "
+                                "WHERE station_name = ANY($1)").format(
+                                    sql.Identifier(schemaName),
+                                    sql.Identifier(tableName))
+            self._executePrepared(statement, ['text[]'], (missing,))
+            for name, stationID in self.cursor.fetchall():
+                self._stationIdCache[(schemaName, tableName, name)] = \
+                    stationID
+                lookup[name] = stationID
+        return lookup
 
     @rollBackOnError
     def close(self):
         '''
-        Close the cursor and connection
+        Close the cursor and connection (or return the connection to the
+        pool if one is in use). Safe to call more than once.
 
         Returns
         -------
         None.
 
         '''
+        if self.connection is None:
+            return
         self.cursor.close()
-        self.connection.close()
+        if self._pool is not None:
+            self._pool.putconn(self.connection)
+        else:
+            self.connection.close()
+        self.connection = None
+        self._pool = None